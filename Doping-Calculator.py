@@ -1,80 +1,182 @@
-from decimal import Decimal, getcontext
 import re
-from sympy import symbols, Matrix, linsolve, Rational
+import sys
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import splu, onenormest, LinearOperator
+from scipy.optimize import nnls
 from collections import defaultdict
+from functools import lru_cache
 
-# Improve Decimal precision
-getcontext().prec = 100
+_FORMULA_RE = re.compile(r"([A-Z][a-z]?)(\d+(?:\.\d+)?)?")
+# Below this many matrix entries a dense solve beats the sparse one. Only
+# square systems go sparse: rectangular ones need an SVD for their rank
+_SPARSE_MIN_SIZE = 64
+# Singular values (or inverse condition number) below this fraction of the
+# largest one count as rank loss, i.e. linearly dependent reagents
+_RANK_RTOL = 1e-12
+
+@lru_cache(maxsize=256)
+def _parse(formula: str, pattern: re.Pattern = _FORMULA_RE) -> tuple:
+    # Cached as an immutable tuple so callers cannot mutate a shared result
+    elements = defaultdict(float)
+    idx = last = 0
+    for m in pattern.finditer(formula):
+        if m.start() != idx:
+            break
+        elem, num = m.groups()
+        elements[elem] += float(num) if num else 1.0
+        last, idx = idx, m.end()
+    if idx != len(formula):
+        # A restricted pattern may have split an unknown symbol ("Co" -> "C" + "o")
+        for pos in (last, idx):
+            g = _FORMULA_RE.match(formula, pos)
+            if g and not pattern.fullmatch(g.group(1)):
+                raise ValueError(f"Mass of element {g.group(1)} not defined")
+        raise ValueError(f"Invalid formula at: {formula[idx:]}")
+    return tuple(elements.items())
 
 class FormulaParser:
     @staticmethod
-    def parse(formula: str) -> dict:
-        elements = {}
-        pattern = re.compile(r"([A-Z][a-z]?)([\d.]*)?")
-        idx = 0
-        while idx < len(formula):
-            m = pattern.match(formula, idx)
-            if not m:
-                raise ValueError(f"Invalid formula at: {formula[idx:]}")
-            elem, num = m.group(1), m.group(2)
-            coeff = Decimal(num) if num else Decimal(1)
-            elements[elem] = elements.get(elem, Decimal(0)) + coeff
-            idx = m.end()
-        return elements
+    def parse(formula: str, pattern: re.Pattern = _FORMULA_RE) -> dict:
+        return dict(_parse(formula, pattern))
+
+    @staticmethod
+    def element_pattern(masses: dict) -> re.Pattern:
+        # Longest symbols first so that e.g. "Cl" wins over "C"
+        symbols = sorted(masses, key=len, reverse=True)
+        return re.compile('(' + '|'.join(map(re.escape, symbols)) + r')(\d+(?:\.\d+)?)?')
+
+def _fill_matrix(rows, cols, vals, out):
+    out[rows, cols] = vals
+
+def _fill_matrix_loop(rows, cols, vals, out):
+    for k in range(vals.shape[0]):
+        out[rows[k], cols[k]] = vals[k]
+
+_jit_fill_matrix = None
+
+def _get_jit_fill_matrix():
+    # numba is optional and imported lazily; the kernel is compiled once per
+    # process and cached on disk, so only --jit runs pay for it
+    global _jit_fill_matrix
+    if _jit_fill_matrix is None:
+        try:
+            import numba
+        except ImportError:
+            _jit_fill_matrix = _fill_matrix
+        else:
+            _jit_fill_matrix = numba.njit(cache=True)(_fill_matrix_loop)
+    return _jit_fill_matrix
+
+def _sparse_square_solve(A, b):
+    # LU-factorise once; a 1-norm condition estimate decides uniqueness
+    try:
+        lu = splu(A.tocsc())
+    except RuntimeError:
+        # Exactly singular
+        return None, False
+    inv = LinearOperator(A.shape, matvec=lu.solve,
+                         rmatvec=lambda v: lu.solve(v, trans='T'), dtype=np.float64)
+    cond = onenormest(A) * onenormest(inv)
+    return lu.solve(b), cond * _RANK_RTOL < 1
+
+def _clamp_zero(x):
+    # Rounding noise around zero would print as -0 or 1e-16 mol; make it exactly 0
+    scale = np.abs(x).max() if x.size else 0.0
+    x = np.where(np.abs(x) <= 1e-12 * scale, 0.0, x)
+    return np.maximum(x, 0.0)
+
+def _read_lines():
+    # Piped input is consumed in one read instead of one input() per value
+    if sys.stdin.isatty():
+        while True:
+            yield input()
+    else:
+        yield from sys.stdin.read().splitlines()
 
 class AtomicMassReader:
     @staticmethod
     def read(filename="atomic_masses.txt") -> dict:
-        masses = {}
         try:
-            with open(filename, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    parts = line.split()
-                    if len(parts) != 2:
-                        raise ValueError(f"Line format error: {line}")
-                    masses[parts[0]] = Decimal(parts[1])
+            with open(filename, 'rb') as f:
+                lines = f.read().splitlines()
         except FileNotFoundError:
             raise FileNotFoundError(f"File {filename} not found")
+        try:
+            masses = {name.decode(): float(val) for name, val in
+                      (p for p in map(bytes.split, lines) if p and not p[0].startswith(b'#'))}
+        except ValueError:
+            # Re-scan only on failure to report the offending line
+            for i, ln in enumerate(lines, 1):
+                parts = ln.split()
+                if not parts or parts[0].startswith(b'#'):
+                    continue
+                try:
+                    name, val = parts
+                    float(val)
+                except ValueError:
+                    raise ValueError(f"Line {i} format error: {ln.decode().strip()}") from None
+            raise
         if not masses:
             raise ValueError("Atomic masses file empty")
         return masses
 
 class SynthesisCalculator:
-    def __init__(self, atomic_masses: dict):
+    def __init__(self, atomic_masses: dict, jit: bool = False):
         self.atomic_masses = atomic_masses
+        self._formula_re = FormulaParser.element_pattern(atomic_masses)
         self.target = {}
-        self.target_mm = Decimal(0)
+        self.target_mm = 0.0
         self.reagents = []
         self.reagent_formulas = []
         self.molar_masses = []
+        self._fill_matrix = _get_jit_fill_matrix() if jit else _fill_matrix
+        self._reagent_key = None
+        self._interactive = sys.stdin.isatty()
+        self._lines = _read_lines()
+
+    def _ask(self, prompt: str) -> str:
+        if self._interactive:
+            print(prompt, end='', flush=True)
+        line = next(self._lines, None)
+        if line is None:
+            raise EOFError("Unexpected end of input")
+        return line
 
     def input_target(self):
-        f = input("Enter target formula: ").strip()
-        self.target = FormulaParser.parse(f)
+        f = self._ask("Enter target formula: ").strip()
+        self.target = FormulaParser.parse(f, self._formula_re)
+        am = self.atomic_masses
+        mm = 0.0
         for e, c in self.target.items():
-            if e not in self.atomic_masses:
-                raise ValueError(f"Mass of element {e} not defined")
-            self.target_mm += c * self.atomic_masses[e]
+            mm += c * am[e]
+        self.target_mm = mm
         print(f"Parsed: {self.target}")
-        print(f"Target molar mass = {self.target_mm.normalize()} g/mol")
+        print(f"Target molar mass = {self.target_mm:.10g} g/mol")
 
     def input_reagents(self):
-        n = int(input("Enter number of reagents: "))
+        n = int(self._ask("Enter number of reagents: "))
+        am = self.atomic_masses
         for i in range(n):
-            f = input(f"Reagent {i+1} formula: ").strip()
+            f = self._ask(f"Reagent {i+1} formula: ").strip()
             self.reagent_formulas.append(f)
-            parsed = FormulaParser.parse(f)
-            mm = sum(parsed[e] * self.atomic_masses[e] for e in parsed)
+            parsed = FormulaParser.parse(f, self._formula_re)
+            mm = 0.0
+            for e, c in parsed.items():
+                mm += c * am[e]
             self.reagents.append(parsed)
             self.molar_masses.append(mm)
-            print(f"{f} molar mass = {mm.normalize()} g/mol")
+            print(f"{f} molar mass = {mm:.10g} g/mol")
+
+    def _reagent_elements(self) -> set:
+        elems = set()
+        for r in self.reagents:
+            elems.update(r)
+        return elems
 
     def validate(self):
         tgt = set(self.target)
-        prov = set().union(*(r.keys() for r in self.reagents))
+        prov = self._reagent_elements()
         miss = tgt - prov
         extra = prov - tgt
         if miss:
@@ -83,54 +185,120 @@ class SynthesisCalculator:
         if extra:
             print(f"Warning: Extra elements: {extra}")
 
+    def _compile_reagent_matrix(self):
+        # Give every reagent element a contiguous index and store reagents as
+        # rows; depends on the reagents only, so new targets reuse it
+        self._elems = sorted(self._reagent_elements())
+        self._elem_index = {e: k for k, e in enumerate(self._elems)}
+        n_elems, n_reagents = len(self._elems), len(self.reagents)
+        self._reagent_matrix = None
+        self._reagent_csr = None
+        # Flat (element, reagent, coefficient) triplets feed both layouts
+        data, row_ind, col_ind = [], [], []
+        for j, r in enumerate(self.reagents):
+            for e, c in r.items():
+                row_ind.append(self._elem_index[e])
+                col_ind.append(j)
+                data.append(c)
+        if n_elems == n_reagents and n_elems * n_reagents >= _SPARSE_MIN_SIZE:
+            # Element x reagent matrix in CSR form only; most entries are zero
+            self._reagent_csr = csr_matrix((data, (row_ind, col_ind)),
+                                           shape=(n_elems, n_reagents))
+        else:
+            R = np.zeros((n_reagents, n_elems))
+            self._fill_matrix(np.array(col_ind, dtype=np.int64),
+                              np.array(row_ind, dtype=np.int64),
+                              np.array(data, dtype=np.float64), R)
+            self._reagent_matrix = R
+
+    def _dense_matrix(self):
+        # Dense element x reagent matrix; densified on demand for large sets
+        if self._reagent_matrix is not None:
+            return self._reagent_matrix.T
+        return self._reagent_csr.toarray()
+
     def solve_basis(self):
         # Construct A, b corresponding to 1 mol 
-        elems = sorted(set(self.target) | set().union(*(r.keys() for r in self.reagents)))
-        A = [[r.get(e, Decimal(0)) for r in self.reagents] for e in elems]
-        b = [self.target.get(e, Decimal(0)) for e in elems]
-        # Convert to rational number to avoid floating point error
-        A_rat = [[Rational(str(val)) for val in row] for row in A]
-        b_rat = [Rational(str(val)) for val in b]
-        vars = symbols(f'x0:{len(self.reagents)}')
-        sol = linsolve((Matrix(A_rat), Matrix(b_rat)), vars)
-        if not sol:
-            print("Error: No exact solution for 1 mol target.")
+        key = tuple(tuple(r.items()) for r in self.reagents)
+        if key != self._reagent_key:
+            self._compile_reagent_matrix()
+            self._reagent_key = key
+        elems = self._elems
+        missing = sorted(set(self.target) - set(self._elem_index))
+        if missing:
+            # No reagent has these elements: their rows would be all zero
+            print("Error: No exact solution for 1 mol target "
+                  f"(no reagent supplies {', '.join(missing)}).")
+            exit()
+        b_np = np.zeros(len(elems))
+        for e, c in self.target.items():
+            b_np[self._elem_index[e]] = c
+        self._target_arr = b_np
+        # Fast unconstrained solve; accept it when it is unique, non-negative and exact.
+        # Uniqueness comes from the numerical rank: LU rarely raises on reagents
+        # that are dependent only up to rounding (e.g. Li2.5S1.7 and Li5S3.4)
+        n_reagents = len(self.reagents)
+        A = self._reagent_csr
+        dense = None
+        if A is None:
+            A = dense = self._dense_matrix()
+            # One SVD gives both the solution and the rank
+            x, _, rank, _ = np.linalg.lstsq(A, b_np, rcond=_RANK_RTOL)
+            unique = rank == n_reagents
+        else:
+            x, unique = _sparse_square_solve(A, b_np)
+        tol = 1e-9 * np.linalg.norm(b_np)
+        if unique and np.all(x >= -1e-12 * np.abs(x).max()) and np.linalg.norm(A @ x - b_np) <= tol:
+            return _clamp_zero(x).tolist(), elems, A
+        # Rank-deficient or negative solution: non-negative least squares.
+        # A sparse system is densified here, once, since nnls needs an array
+        A = dense if dense is not None else self._dense_matrix()
+        x, rnorm = nnls(A, b_np)
+        if rnorm > tol:
+            worst = int(np.argmax(np.abs(A @ x - b_np)))
+            print("Error: No non-negative exact solution for 1 mol target "
+                  f"(residual {rnorm:.3g}, least balanced element: {elems[worst]}).")
             exit()
-        tup = next(iter(sol))
-        # Convert rational to decimal exact representation
-        base = {}
-        for i, r in enumerate(tup):
-            base[vars[i]] = Decimal(r.p) / Decimal(r.q)
-        return base, elems
+        if not unique:
+            print("Warning: Reagents are linearly dependent, so the recipe is not unique; "
+                  "using the non-negative least-squares solution, "
+                  "which draws only on linearly independent reagents.")
+        return _clamp_zero(x).tolist(), elems, A
 
     def calculate(self):
-        t = input("Input type (0 mass g, 1 moles): ").strip()
+        t = self._ask("Input type (0 mass g, 1 moles): ").strip()
         if t not in ['0','1']:
             print("Invalid type")
             exit()
-        v = Decimal(input("Amount: ").strip())
+        v = float(self._ask("Amount: ").strip())
         n = v / self.target_mm if t=='0' else v
-        print(f"Target moles = {n.normalize()}")
+        print(f"Target moles = {n:.10g}")
 
-        base, elems = self.solve_basis()
-        print("\nReagent requirements:\n" + "="*40)
-        total_mass = Decimal(0)
-        for i, var in enumerate(sorted(base.keys(), key=lambda x: int(str(x)[1:]))):
-            moles = base[var] * n
+        x_values, elems, A = self.solve_basis()
+        lines = ["\nReagent requirements:\n" + "="*40]
+        total_mass = 0.0
+        for i, x_i in enumerate(x_values):
+            moles = x_i * n
             mass = moles * self.molar_masses[i]
             total_mass += mass
-            print(f"Reagent {i+1} ({self.reagent_formulas[i]}):")
-            print(f"  Moles: {moles.normalize():.10f} mol")
-            print(f"  Mass:  {mass.normalize():.10f} g\n")
-        print(f"Total mass = {total_mass.normalize():.10f} g")
+            lines.append(f"Reagent {i+1} ({self.reagent_formulas[i]}):\n"
+                         f"  Moles: {moles:.10g} mol\n"
+                         f"  Mass:  {mass:.10g} g\n")
+        lines.append(f"Total mass = {total_mass:.10g} g")
 
         #Verify element balance
-        print("Verification:")
-        for e in elems:
-            actual = sum((base[symbols(f'x{i}')] * n) * r.get(e, Decimal(0))
-                         for i, r in enumerate(self.reagents))
-            target_amt = self.target.get(e, Decimal(0)) * n
-            print(f"{e}: target {target_amt.normalize():.10f}, actual {actual.normalize():.10f}")
+        lines.append("Verification:")
+        x_vec = np.array(x_values)
+        actual_vec = A @ x_vec * n
+        target_vec = self._target_arr * n
+        for e, target_amt, actual in zip(elems, target_vec, actual_vec):
+            lines.append(f"{e}: target {target_amt:.10g}, actual {actual:.10g}")
+        # Tolerance relative to the amounts involved (~1e-3 mol for a 1 g target)
+        scale = np.abs(target_vec).max() if target_vec.size else 0.0
+        if not np.allclose(actual_vec, target_vec, rtol=1e-9, atol=1e-9 * scale):
+            lines.append("Warning: Element balance not satisfied")
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
 
 
 def main():
@@ -142,7 +310,7 @@ def main():
     except Exception as e:
         print(e)
         exit()
-    calc = SynthesisCalculator(masses)
+    calc = SynthesisCalculator(masses, jit="--jit" in sys.argv[1:])
     calc.input_target()
     calc.input_reagents()
     calc.validate()
@@ -0,0 +1,73 @@
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+_spec = importlib.util.spec_from_file_location("doping_calculator", ROOT / "Doping-Calculator.py")
+dc = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(dc)
+
+MASSES = dc.AtomicMassReader.read(str(ROOT / "atomic_masses.txt"))
+# Made-up elements for systems large enough to take the sparse path
+FAKE_MASSES = {f"E{c}": 1.0 for c in "abcdefgh"}
+
+
+def make_calc(target, reagents, masses=MASSES):
+    calc = dc.SynthesisCalculator(masses)
+    calc._interactive = False
+    calc._lines = iter([target, str(len(reagents)), *reagents])
+    calc.input_target()
+    calc.input_reagents()
+    return calc
+
+
+def solve(calc):
+    x, elems, A = calc.solve_basis()
+    x = np.array(x)
+    assert np.all(x >= 0)
+    assert np.allclose(A @ x, calc._target_arr, rtol=0, atol=1e-9)
+    return x
+
+
+def test_unique_recipe(capsys):
+    calc = make_calc("Li5.5PS4.5Cl1.5", ["LiCl", "P2S5", "Li2S"])
+    x = solve(calc)
+    assert np.allclose(x, [1.5, 0.5, 2.0])
+    assert "not unique" not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("target, reagents", [
+    ("Li2S", ["Li2S", "Li", "S"]),
+    # Proportional up to rounding only: LU does not raise on this pair
+    ("Li2.5S1.7", ["Li2.5S1.7", "Li5S3.4"]),
+])
+def test_dependent_reagents_warn(capsys, target, reagents):
+    solve(make_calc(target, reagents))
+    assert "not unique" in capsys.readouterr().out
+
+
+def test_dependent_reagents_warn_sparse(capsys):
+    calc = make_calc("EaEbEcEdEeEfEg2.5Eh1.7",
+                     ["Ea", "Eb", "Ec", "Ed", "Ee", "Ef", "Eg2.5Eh1.7", "Eg5Eh3.4"],
+                     masses=FAKE_MASSES)
+    solve(calc)
+    assert calc._reagent_csr is not None
+    assert "not unique" in capsys.readouterr().out
+
+
+def test_new_target_reuses_reagent_matrix():
+    calc = make_calc("Li5.5PS4.5Cl1.5", ["LiCl", "P2S5", "Li2S"])
+    solve(calc)
+    R = calc._reagent_matrix
+    calc._lines = iter(["Li6PS5Cl"])
+    calc.input_target()
+    assert np.allclose(solve(calc), [1.0, 0.5, 2.5])
+    assert calc._reagent_matrix is R
+
+
+def test_unused_reagent_is_exactly_zero():
+    x = solve(make_calc("Li2S", ["Li2S", "LiCl"]))
+    assert x[1] == 0.0 and not np.signbit(x[1])
+    assert np.allclose(x[0], 1.0)